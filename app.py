@@ -1,14 +1,23 @@
+import codecs
 import os
 import re
-import shutil
-import subprocess
+import tempfile
 import logging
+import threading
+import time
 import uuid
-import json
+from functools import lru_cache
+from collections import OrderedDict, defaultdict
 from datetime import datetime
-from flask import Flask, request, render_template, Response, stream_with_context, session, jsonify, send_file
+from flask import Flask, request, render_template, Response, stream_with_context, session, jsonify, g
 from flask_session import Session
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
+from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename
+import ijson
+import orjson
+import requests
 import secrets
 
 # ---------------------------
@@ -21,7 +30,10 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'False') == 'True'
     
     # Ollama settings
-    OLLAMA_PATH = shutil.which("ollama") or "/usr/local/bin/ollama"
+    OLLAMA_API_URL = os.environ.get('OLLAMA_API_URL', 'http://127.0.0.1:11434')
+    MODELS_CACHE_TTL = 30  # seconds to reuse the installed-models list
+    SSE_BATCH_INTERVAL = 0.05  # seconds to coalesce streamed lines into one SSE event
+    SSE_BATCH_BYTES = 4096
     DEFAULT_MODEL = "deepseek-r1:14b"
     
     # Default available models (can be extended by users)
@@ -43,6 +55,21 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'txt', 'md', 'json'}
+    MAX_IMPORT_CHATS = 1000
+    MAX_IMPORT_MESSAGES_PER_CHAT = 5000
+    
+    # Chat history storage - Redis when REDIS_URL is set, otherwise one file per chat
+    REDIS_URL = os.environ.get('REDIS_URL')
+    CHAT_FOLDER = 'chat_data'
+    MAX_SEARCH_INDEXES = 100  # per worker, least recently used are dropped
+    
+    # Response cache for the model list and the main page, shared by all
+    # workers through Redis when REDIS_URL is set. The per-process SimpleCache
+    # only drops its own entries on /add_model and /remove_model; other
+    # workers catch up within CACHE_DEFAULT_TIMEOUT.
+    CACHE_TYPE = 'RedisCache' if REDIS_URL else 'SimpleCache'
+    CACHE_REDIS_URL = REDIS_URL
+    CACHE_DEFAULT_TIMEOUT = 30
     
     # Security settings - disable CSRF for local AI application
     WTF_CSRF_ENABLED = False
@@ -50,15 +77,42 @@ class Config:
 # ---------------------------
 # Initialize Flask Application
 # ---------------------------
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify() and request.get_json()."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson already produces UTF-8 bytes, skip the str round-trip of dumps()
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(Config)
+
+if app.config['REDIS_URL']:
+    import redis
+    redis_client = redis.from_url(app.config['REDIS_URL'])
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client
+else:
+    redis_client = None
+
 Session(app)
+cache = Cache(app)
 
 # Note: CSRF protection disabled for local AI application
 # If you need CSRF protection in production, enable it and add proper token handling
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+if redis_client is None:
+    os.makedirs(app.config['CHAT_FOLDER'], exist_ok=True)
 
 # Configure logging
 logging.basicConfig(
@@ -67,34 +121,349 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ANSI escape sequence cleaner (for cleaning LLM output)
-ansi_escape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
+# Allowed characters in Ollama model names
+model_name_pattern = re.compile(r'\A[a-zA-Z0-9._:-]+\Z')
+
+# Upload extensions, frozen once so allowed_file() skips the config lookup
+allowed_extensions = frozenset(app.config['ALLOWED_EXTENSIONS'])
+
+# Shared HTTP session so requests to the Ollama daemon reuse pooled keep-alive connections
+ollama_http = requests.Session()
+
+def index_cache_key() -> str:
+    """Cache key for the main page, which lists the user's custom models too."""
+    return "view//|" + "|".join(session.get('user_models', []))
+
+def is_ok_response(rv) -> bool:
+    """Only cache successful view responses."""
+    return (rv[1] if isinstance(rv, tuple) else 200) == 200
+
+def has_model_options(rv) -> bool:
+    """Don't cache a main page rendered without models, e.g. while Ollama is down."""
+    return bool(g.get('models'))
 
 ## let's fix the DEFAULT Models in the Config class
 
-def extract_models() -> list:
-    try: ## in case ollama is not installed properly
-        command = "ollama list > temp.txt"
-        os.system(command)
-    except Exception as es:
-        print(f"Has ollama been properly installed? Error code is =-> {es}")
-        x = input("Press ENTER to terminate.")
-        sys.exit()
-
-    with open("temp.txt") as fd:
-        result = fd.readlines()
-    os.remove("temp.txt")
-
-    index = 0
-    name_list = []
-    for element in result:
-        if index == 0:
-            index += 1
+_models_cache = {"ts": float("-inf"), "data": []}
+
+def extract_models(force_refresh: bool = False) -> list:
+    """Return the names of models installed in Ollama.
+
+    Queries the Ollama HTTP API and caches the result for
+    Config.MODELS_CACHE_TTL seconds. Raises requests.RequestException if
+    Ollama cannot be reached.
+    """
+    now = time.monotonic()
+    if not force_refresh and now - _models_cache["ts"] < Config.MODELS_CACHE_TTL:
+        return list(_models_cache["data"])
+
+    r = ollama_http.get(f"{Config.OLLAMA_API_URL}/api/tags", timeout=2)
+    r.raise_for_status()
+    name_list = [m["name"] for m in r.json().get("models", [])]
+
+    _models_cache["ts"] = now
+    _models_cache["data"] = name_list
+    return list(name_list)
+
+_probe_cache = {"ts": float("-inf"), "version": None}
+
+def _probe_ollama_cached(ttl: float = Config.MODELS_CACHE_TTL) -> str:
+    """Return the Ollama daemon version, reusing a successful probe for ttl seconds.
+
+    Failures are not cached, so a recovered daemon reports healthy on the next
+    call. Raises requests.RequestException if Ollama cannot be reached.
+    """
+    now = time.monotonic()
+    if now - _probe_cache["ts"] < ttl:
+        return _probe_cache["version"]
+
+    r = ollama_http.get(f"{Config.OLLAMA_API_URL}/api/version", timeout=5)
+    r.raise_for_status()
+    version = r.json().get("version", "unknown")
+
+    _probe_cache["ts"] = now
+    _probe_cache["version"] = version
+    return version
+
+# ---------------------------
+# Chat Storage
+# ---------------------------
+# Chat histories live outside the session so that appending a message writes
+# only that message instead of re-serializing every chat on each request.
+
+class FileChatStore:
+    """Chat histories stored as one JSON-lines file per chat."""
+
+    def __init__(self, root: str, user_id: str):
+        self.root = os.path.join(root, user_id)
+
+    def _path(self, chat_id: str) -> str:
+        return os.path.join(self.root, f"{chat_id}.jsonl")
+
+    def chat_ids(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        return [name[:-len(".jsonl")] for name in os.listdir(self.root) if name.endswith(".jsonl")]
+
+    def exists(self, chat_id: str) -> bool:
+        return os.path.exists(self._path(chat_id))
+
+    def create(self, chat_id: str, messages: list = ()):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(chat_id), 'wb') as f:
+            f.write(b"".join(orjson.dumps(m) + b"\n" for m in messages))
+
+    def extend(self, chat_id: str, messages: list):
+        """Append messages and return the (before, after) versions of this write.
+
+        Returns None when another process appended at the same time, since the
+        new messages' positions in the file are then unknown.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        data = b"".join(orjson.dumps(m) + b"\n" for m in messages)
+        with open(self._path(chat_id), 'ab') as f:
+            before = os.fstat(f.fileno())
+            f.write(data)
+            f.flush()
+            after = os.fstat(f.fileno())
+        if after.st_size != before.st_size + len(data):
+            return None
+        return self._stat_version(before), self._stat_version(after)
+
+    def messages(self, chat_id: str) -> list:
+        try:
+            with open(self._path(chat_id), 'rb') as f:
+                return [orjson.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def delete(self, chat_id: str) -> bool:
+        try:
+            os.remove(self._path(chat_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def version(self, chat_id: str):
+        """Return a value that changes whenever the chat is written."""
+        try:
+            st = os.stat(self._path(chat_id))
+        except FileNotFoundError:
+            return None
+        return self._stat_version(st)
+
+    @staticmethod
+    def _stat_version(st):
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def versions(self) -> dict:
+        return {chat_id: self.version(chat_id) for chat_id in self.chat_ids()}
+
+class RedisChatStore:
+    """Chat histories stored as one Redis list per chat plus a set of chat ids.
+
+    A hash of per-chat write counters backs version(); counters are never
+    reset, so a deleted and recreated chat still gets a new version.
+    """
+
+    def __init__(self, client, user_id: str):
+        self.r = client
+        self.prefix = f"chat:{user_id}"
+        self.ids_key = f"{self.prefix}:ids"
+        self.versions_key = f"{self.prefix}:versions"
+
+    def _key(self, chat_id: str) -> str:
+        return f"{self.prefix}:{chat_id}"
+
+    def chat_ids(self) -> list:
+        return [chat_id.decode() for chat_id in self.r.smembers(self.ids_key)]
+
+    def exists(self, chat_id: str) -> bool:
+        return bool(self.r.sismember(self.ids_key, chat_id))
+
+    def create(self, chat_id: str, messages: list = ()):
+        pipe = self.r.pipeline()
+        pipe.delete(self._key(chat_id))
+        if messages:
+            pipe.rpush(self._key(chat_id), *(orjson.dumps(m) for m in messages))
+        pipe.sadd(self.ids_key, chat_id)
+        pipe.hincrby(self.versions_key, chat_id, 1)
+        pipe.execute()
+
+    def extend(self, chat_id: str, messages: list):
+        """Append messages and return the (before, after) versions of this write.
+
+        The pipeline runs as a transaction, so the counter it bumps always
+        belongs to this write.
+        """
+        pipe = self.r.pipeline()
+        pipe.rpush(self._key(chat_id), *(orjson.dumps(m) for m in messages))
+        pipe.sadd(self.ids_key, chat_id)
+        pipe.hincrby(self.versions_key, chat_id, 1)
+        counter = pipe.execute()[2]
+        before = str(counter - 1).encode() if counter > 1 else None
+        return before, str(counter).encode()
+
+    def messages(self, chat_id: str) -> list:
+        return [orjson.loads(m) for m in self.r.lrange(self._key(chat_id), 0, -1)]
+
+    def delete(self, chat_id: str) -> bool:
+        pipe = self.r.pipeline()
+        pipe.delete(self._key(chat_id))
+        pipe.srem(self.ids_key, chat_id)
+        pipe.hincrby(self.versions_key, chat_id, 1)
+        return bool(pipe.execute()[1])
+
+    def version(self, chat_id: str):
+        """Return a value that changes whenever the chat is written."""
+        return self.r.hget(self.versions_key, chat_id)
+
+    def versions(self) -> dict:
+        chat_ids = self.chat_ids()
+        if not chat_ids:
+            return {}
+        return dict(zip(chat_ids, self.r.hmget(self.versions_key, chat_ids)))
+
+def get_chat_store():
+    """Get the chat store for the current session's user."""
+    if 'chat_store' not in g:
+        if 'user_id' not in session:
+            session['user_id'] = str(uuid.uuid4())
+        if redis_client is not None:
+            g.chat_store = RedisChatStore(redis_client, session['user_id'])
+        else:
+            g.chat_store = FileChatStore(app.config['CHAT_FOLDER'], session['user_id'])
+        migrate_session_chats(g.chat_store)
+    return g.chat_store
+
+def migrate_session_chats(store):
+    """Move chat histories saved in the session by older versions into the store."""
+    legacy = session.pop('chat_histories', None)
+    if not isinstance(legacy, dict):
+        return
+    migrated = 0
+    for chat_id, messages in legacy.items():
+        if not is_valid_chat_id(chat_id) or not isinstance(messages, list) \
+                or not all(is_valid_message(m) for m in messages):
+            logger.warning(f"Skipping invalid session chat {chat_id!r} during migration")
             continue
-        temp_list = element.split(' ')
-        name_list.append(temp_list[0])
+        if not store.exists(chat_id):
+            store.create(chat_id, [clean_message(m) for m in messages])
+            migrated += 1
+    logger.info(f"Migrated {migrated} chats from the session into the chat store")
+
+# ---------------------------
+# Search Index
+# ---------------------------
+class SearchIndex:
+    """Trigram index over one user's chat messages.
+
+    Each chat is stamped with the store version it was indexed at; sync()
+    re-reads only chats whose version changed, so writes made by an import,
+    another worker or a previous process are picked up on the next search.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)  # trigram -> {chat_id: {message_index, ...}}
+        self.chat_trigrams = {}            # chat_id -> trigrams indexed for that chat
+        self.sizes = {}                    # chat_id -> number of messages indexed
+        self.versions = {}                 # chat_id -> store version when indexed
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, chat_id: str, message_index: int, content_lower: str):
+        grams = self.trigrams(content_lower)
+        for gram in grams:
+            self.postings[gram].setdefault(chat_id, set()).add(message_index)
+        self.chat_trigrams.setdefault(chat_id, set()).update(grams)
+        self.sizes[chat_id] = message_index + 1
+
+    def extend(self, chat_id: str, contents_lower: list, written):
+        """Index freshly appended messages if the chat was up to date before them.
+
+        written is the (before, after) pair returned by the store's extend().
+        Unless it shows this append directly followed the indexed version, the
+        chat is dropped so the next sync() re-reads it.
+        """
+        with self.lock:
+            if written is None or self.versions.get(chat_id) != written[0]:
+                self.drop(chat_id)
+                return
+            start = self.sizes.get(chat_id, 0)
+            for offset, content_lower in enumerate(contents_lower):
+                self.add(chat_id, start + offset, content_lower)
+            self.versions[chat_id] = written[1]
+
+    def drop(self, chat_id: str):
+        for gram in self.chat_trigrams.pop(chat_id, ()):
+            chats = self.postings[gram]
+            chats.pop(chat_id, None)
+            if not chats:
+                del self.postings[gram]
+        self.sizes.pop(chat_id, None)
+        self.versions.pop(chat_id, None)
+
+    def sync(self, store):
+        """Bring the index up to date with the store. Caller holds self.lock."""
+        current = store.versions()
+        for chat_id in [c for c in self.versions if c not in current]:
+            self.drop(chat_id)
+        for chat_id, version in current.items():
+            if self.versions.get(chat_id) != version:
+                self.drop(chat_id)
+                for i, message in enumerate(store.messages(chat_id)):
+                    self.add(chat_id, i, lowered_content(message))
+                self.versions[chat_id] = version
+
+    def candidates(self, query_lower: str):
+        """Return {chat_id: message indexes} holding every trigram of the query.
+
+        Returns None when the query is shorter than a trigram.
+        """
+        grams = self.trigrams(query_lower)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(gram, {}) for gram in grams), key=len)
+        result = {}
+        for chat_id, indexes in postings[0].items():
+            for other in postings[1:]:
+                indexes = indexes & other.get(chat_id, set())
+                if not indexes:
+                    break
+            if indexes:
+                result[chat_id] = indexes
+        return result
 
-    return name_list
+def lowered_content(message: dict) -> str:
+    """Lowercased message content, precomputed by append_message() when available."""
+    content_lower = message.get('content_lower')
+    if isinstance(content_lower, str):
+        return content_lower
+    return message['content'].lower()
+
+# Per-user indexes, rebuilt lazily from the chat store after a restart or eviction
+_search_indexes = OrderedDict()
+_search_indexes_lock = threading.Lock()
+
+def get_search_index() -> SearchIndex:
+    """Get the search index for the current session's user.
+
+    Only the MAX_SEARCH_INDEXES most recently used indexes are kept.
+    """
+    get_chat_store()  # ensures session['user_id']
+    user_id = session['user_id']
+    with _search_indexes_lock:
+        index = _search_indexes.get(user_id)
+        if index is None:
+            index = _search_indexes[user_id] = SearchIndex()
+            while len(_search_indexes) > Config.MAX_SEARCH_INDEXES:
+                _search_indexes.popitem(last=False)
+        else:
+            _search_indexes.move_to_end(user_id)
+    return index
 
 # ---------------------------
 # Helper Functions
@@ -103,11 +472,15 @@ def generate_chat_id() -> str:
     """Generate a unique chat identifier using UUID4."""
     return str(uuid.uuid4())
 
-def get_user_models() -> list:
-    """Get user's custom models from session, merged with defaults."""
+def _compute_user_models() -> list:
+    """Merge the user's custom models from session with the Ollama models."""
     user_models = session.get('user_models', [])
     #all_models = list(Config.DEFAULT_MODELS)
-    all_models = extract_models()
+    try:
+        all_models = extract_models()
+    except requests.RequestException as e:
+        logger.error(f"Unable to list Ollama models: {str(e)}")
+        all_models = []
     
     # Add user models that aren't already in defaults
     for model in user_models:
@@ -116,29 +489,33 @@ def get_user_models() -> list:
     
     return all_models
 
+def get_user_models() -> list:
+    """Get user's custom models from session, merged with defaults.
+
+    The result is memoized on flask.g so it is computed at most once per request.
+    """
+    if not hasattr(g, "models"):
+        g.models = _compute_user_models()
+    return g.models
+
 def add_user_model(model_name: str) -> tuple[bool, str]:
     """Add a custom model to user's list."""
     try:
         # Validate model name format
-        if not re.match(r'^[a-zA-Z0-9._:-]+$', model_name):
+        if not model_name_pattern.match(model_name):
             return False, "Invalid model name format. Use only letters, numbers, dots, hyphens, colons, and underscores."
         
         if len(model_name) > 100:
             return False, "Model name too long (max 100 characters)."
         
-        # Check if model exists in Ollama
-        result = subprocess.run(
-            [Config.OLLAMA_PATH, "list"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
+        # Check if model exists in Ollama (bypass the cache, it may have just been pulled)
+        try:
+            available_models = extract_models(force_refresh=True)
+        except requests.Timeout:
+            return False, "Timeout while checking Ollama models. Please try again."
+        except requests.RequestException:
             return False, "Unable to connect to Ollama. Please ensure Ollama is running."
         
-        available_models = [line.split()[0] for line in result.stdout.strip().split('\n') if line.strip()]
-        
         if model_name not in available_models:
             return False, f"Model '{model_name}' not found in Ollama. Please pull the model first with: ollama pull {model_name}"
         
@@ -149,13 +526,12 @@ def add_user_model(model_name: str) -> tuple[bool, str]:
         if model_name not in session['user_models']:
             session['user_models'].append(model_name)
             session.modified = True
+            g.pop("models", None)
             logger.info(f"Added custom model: {model_name}")
             return True, f"Successfully added model '{model_name}'"
         else:
             return False, f"Model '{model_name}' is already in your list."
             
-    except subprocess.TimeoutExpired:
-        return False, "Timeout while checking Ollama models. Please try again."
     except Exception as e:
         logger.error(f"Error adding model {model_name}: {str(e)}")
         return False, "An error occurred while adding the model. Please try again."
@@ -167,17 +543,30 @@ def remove_user_model(model_name: str) -> tuple[bool, str]:
     
     #if model_name in Config.DEFAULT_MODELS:
     ## Do not remove the last model
-    if len(extract_models()) == 1:
-        return False, "Cannot remove model."
+    try:
+        if len(extract_models()) == 1:
+            return False, "Cannot remove model."
+    except requests.RequestException:
+        return False, "Unable to connect to Ollama. Please ensure Ollama is running."
     
     if model_name in session['user_models']:
         session['user_models'].remove(model_name)
         session.modified = True
+        g.pop("models", None)
         logger.info(f"Removed custom model: {model_name}")
         return True, f"Successfully removed model '{model_name}'"
     else:
         return False, f"Model '{model_name}' not found in your custom models."
 
+def is_valid_chat_id(chat_id) -> bool:
+    """Check that a chat id is a canonical UUID string (chat ids are used in storage keys and paths)."""
+    if not isinstance(chat_id, str):
+        return False
+    try:
+        return str(uuid.UUID(chat_id)) == chat_id
+    except ValueError:
+        return False
+
 def validate_input(data: dict, required_fields: list) -> tuple[bool, str]:
     """Validate input data for required fields and basic sanitization."""
     for field in required_fields:
@@ -188,7 +577,7 @@ def validate_input(data: dict, required_fields: list) -> tuple[bool, str]:
     if 'prompt' in data and len(data['prompt']) > 10000:
         return False, "Your message is too long. Please keep it under 10,000 characters."
     
-    if 'chat_id' in data and not re.match(r'^[a-f0-9-]{36}$', data['chat_id']):
+    if 'chat_id' in data and not is_valid_chat_id(data['chat_id']):
         return False, "Invalid chat session. Please refresh the page and try again."
     
     if 'model' in data and len(data['model']) > 100:
@@ -196,58 +585,181 @@ def validate_input(data: dict, required_fields: list) -> tuple[bool, str]:
     
     return True, ""
 
+def is_valid_message(message) -> bool:
+    """Check that an imported message has the fields the app reads."""
+    return isinstance(message, dict) and isinstance(message.get('role'), str) \
+        and isinstance(message.get('content'), str)
+
+def clean_message(message: dict) -> dict:
+    """Copy of a validated imported message with only the fields the app writes.
+
+    content_lower is always recomputed; an uploaded value is never trusted.
+    """
+    cleaned = {
+        "role": message['role'],
+        "content": message['content'],
+        "content_lower": message['content'].lower()
+    }
+    if isinstance(message.get('timestamp'), str):
+        cleaned["timestamp"] = message['timestamp']
+    return cleaned
+
+def is_utf8_stream(stream) -> bool:
+    """Check a seekable byte stream for valid UTF-8, reading it in chunks.
+
+    Only used to explain a parse error: the yajl2_c ijson backend reports bad
+    encoding as a generic JSON error.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    stream.seek(0)
+    try:
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def iter_import_file(stream):
+    """Parse an export file in a single ijson pass.
+
+    Yields ("chat_histories", None, None) when the chat_histories object
+    starts, ("chat", chat_id, messages) after each of its entries and
+    ("model", None, name) for each string in user_models. Only one chat is
+    held in memory at a time; a chat with more than
+    MAX_IMPORT_MESSAGES_PER_CHAT messages stops being built and is yielded
+    with messages set to None.
+    """
+    builder = None
+    chat_id = None
+    depth = 0
+    count = 0
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if chat_id is not None:
+            # Inside the value of one chat_histories entry
+            if depth == 1 and event in ('start_map', 'start_array'):
+                count += 1
+                if count > Config.MAX_IMPORT_MESSAGES_PER_CHAT:
+                    builder = None
+            if builder is not None:
+                builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                yield "chat", chat_id, builder.value if builder is not None else None
+                chat_id = None
+        elif prefix == 'chat_histories':
+            if event == 'start_map':
+                yield "chat_histories", None, None
+            elif event == 'map_key':
+                chat_id = value
+                builder = ijson.ObjectBuilder()
+                depth = 0
+                count = 0
+        elif prefix == 'user_models.item' and event == 'string':
+            yield "model", None, value
+
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe storage."""
     return secure_filename(filename)
 
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    i = filename.rfind('.')
+    return i != -1 and filename[i + 1:].lower() in allowed_extensions
 
 def initialize_chat_history(chat_id: str):
     """Initialize chat history for a new chat."""
-    if 'chat_histories' not in session:
-        session['chat_histories'] = {}
-    session['chat_histories'][chat_id] = []
-    session.modified = True
+    get_chat_store().create(chat_id)
     logger.debug(f"Initialized chat history for chat_id {chat_id}.")
 
 def append_message(chat_id: str, role: str, content: str):
-    """Append a message to the chat history."""
-    if 'chat_histories' not in session:
-        session['chat_histories'] = {}
-    if chat_id not in session['chat_histories']:
-        initialize_chat_history(chat_id)
-    
+    """Append a message to the chat history.
+
+    Messages are queued on flask.g and written by flush_pending_messages()
+    when the request ends, so a chat turn costs one store write.
+    """
     message = {
         "role": role, 
         "content": content,
+        "content_lower": content.lower(),
         "timestamp": datetime.now().isoformat()
     }
-    session['chat_histories'][chat_id].append(message)
-    session.modified = True
+    g.setdefault('pending_messages', {}).setdefault(chat_id, []).append(message)
     logger.debug(f"Appended {role} message to chat_id {chat_id}")
 
+def pending_messages(chat_id: str) -> list:
+    """Messages appended during this request that are not written yet."""
+    return g.get('pending_messages', {}).get(chat_id, [])
+
+@app.teardown_request
+def flush_pending_messages(exc=None):
+    """Write the messages queued by append_message(), one write per chat.
+
+    Streaming responses use stream_with_context, so this runs after the
+    generator has finished and the assistant reply is queued as well.
+    """
+    pending = g.pop('pending_messages', None)
+    if not pending:
+        return
+    store = get_chat_store()
+    index = _search_indexes.get(session['user_id'])
+    for chat_id, messages in pending.items():
+        try:
+            written = store.extend(chat_id, messages)
+            if index is not None:
+                index.extend(chat_id, [m['content_lower'] for m in messages], written)
+        except Exception as e:
+            logger.error(f"Failed to save messages for chat_id {chat_id}: {str(e)}")
+
 def build_full_prompt(chat_id: str) -> str:
     """Build the full prompt including chat history."""
-    full_prompt = ""
-    for message in session['chat_histories'].get(chat_id, []):
-        role = "Human" if message["role"] == "user" else "Assistant"
-        full_prompt += f"{role}: {message['content']}\n"
-    logger.debug(f"Full prompt for chat_id {chat_id}:\n{full_prompt}")
+    parts = [
+        f"{'Human' if message['role'] == 'user' else 'Assistant'}: {message['content']}\n"
+        for message in get_chat_store().messages(chat_id) + pending_messages(chat_id)
+    ]
+    full_prompt = "".join(parts)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Full prompt for chat_id {chat_id}:\n{full_prompt}")
     return full_prompt
 
+# The page is rendered once with this marker where the model <option>s go
+MODEL_OPTIONS_PLACEHOLDER = "<!--MODEL_OPTIONS-->"
+
+@lru_cache(maxsize=1)
+def base_page_html() -> str:
+    """Render the main page template once, leaving a slot for the model options."""
+    return render_template('index.html', model_options=Markup(MODEL_OPTIONS_PLACEHOLDER))
+
+@lru_cache(maxsize=8)
+def render_model_options(models: tuple) -> str:
+    """Build the model <option> elements for a given model list."""
+    return "".join(f'<option value="{escape(m)}">{escape(m)}</option>' for m in models)
+
 def search_chat_history(query: str) -> list:
     """Search through all chat histories for messages containing the query."""
     results = []
-    if 'chat_histories' not in session:
-        return results
+    store = get_chat_store()
+    index = get_search_index()
     
     query_lower = query.lower()
-    for chat_id, messages in session['chat_histories'].items():
-        for i, message in enumerate(messages):
-            if query_lower in message['content'].lower():
+    with index.lock:
+        index.sync(store)
+        candidates = index.candidates(query_lower)
+    if candidates is None:
+        candidates = dict.fromkeys(store.chat_ids())
+    
+    # Verify the trigram hits with a substring check on just those messages
+    for chat_id in sorted(candidates):
+        messages = store.messages(chat_id)
+        indexes = candidates[chat_id]
+        for i in sorted(indexes) if indexes is not None else range(len(messages)):
+            if i >= len(messages):
+                continue
+            message = messages[i]
+            if query_lower in lowered_content(message):
                 results.append({
                     'chat_id': chat_id,
                     'message_index': i,
@@ -264,22 +776,16 @@ def search_chat_history(query: str) -> list:
 def health_check():
     """Endpoint for system health monitoring."""
     try:
-        result = subprocess.run(
-            [Config.OLLAMA_PATH, "--version"],
-            capture_output=True,
-            check=True,
-            text=True,
-            timeout=5
-        )
-        logger.debug(f"Ollama version: {result.stdout.strip()}")
+        version = _probe_ollama_cached()
+        logger.debug(f"Ollama version: {version}")
         return jsonify({
             "status": "healthy",
             "ollama": "accessible",
-            "version": result.stdout.strip(),
+            "version": version,
             "timestamp": datetime.now().isoformat(),
             "message": "System is running normally"
         }), 200
-    except subprocess.TimeoutExpired:
+    except requests.Timeout:
         logger.error("Health check timed out")
         return jsonify({
             "status": "unhealthy", 
@@ -287,12 +793,12 @@ def health_check():
             "message": "Unable to connect to Ollama within 5 seconds",
             "timestamp": datetime.now().isoformat()
         }), 503
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ollama command failed: {e}")
+    except requests.RequestException as e:
+        logger.error(f"Ollama request failed: {e}")
         return jsonify({
             "status": "unhealthy",
-            "error": "Ollama command failed",
-            "message": "Ollama may not be installed or accessible",
+            "error": "Ollama request failed",
+            "message": "Ollama may not be running or accessible",
             "timestamp": datetime.now().isoformat()
         }), 503
     except Exception as e:
@@ -305,28 +811,22 @@ def health_check():
         }), 503
 
 @app.route("/models", methods=["GET"])
+@cache.cached(response_filter=is_ok_response)
 def list_models():
     """Endpoint to list available Ollama models."""
     try:
-        result = subprocess.run(
-            [Config.OLLAMA_PATH, "list"],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=10
-        )
-        models = [line.strip() for line in result.stdout.strip().split("\n") if line.strip()]
+        models = extract_models()
         logger.debug(f"Available models: {models}")
         return jsonify({
             "models": models,
             "message": f"Found {len(models)} available models"
         }), 200
-    except subprocess.TimeoutExpired:
+    except requests.Timeout:
         return jsonify({
             "error": "Request timeout", 
-            "message": "Unable to retrieve models within 10 seconds. Please try again."
+            "message": "Unable to retrieve models in time. Please try again."
         }), 500
-    except subprocess.CalledProcessError as e:
+    except requests.RequestException as e:
         return jsonify({
             "error": "Ollama error",
             "message": "Unable to retrieve models from Ollama. Please ensure Ollama is running."
@@ -351,6 +851,7 @@ def add_model():
         success, message = add_user_model(model_name)
         
         if success:
+            cache.delete('view//models')
             return jsonify({
                 "message": message,
                 "models": get_user_models()
@@ -378,6 +879,7 @@ def remove_model():
         success, message = remove_user_model(model_name)
         
         if success:
+            cache.delete('view//models')
             return jsonify({
                 "message": message,
                 "models": get_user_models()
@@ -425,26 +927,38 @@ def search():
 def export_chats():
     """Export all chat histories as JSON."""
     try:
-        if not session.get('chat_histories'):
+        store = get_chat_store()
+        chat_ids = store.chat_ids()
+        if not chat_ids:
             return jsonify({
                 "error": "No chats to export",
                 "message": "You don't have any chat histories to export."
             }), 400
         
-        chat_data = {
-            "export_timestamp": datetime.now().isoformat(),
-            "chat_histories": session.get('chat_histories', {}),
-            "user_models": session.get('user_models', []),
-            "version": "1.0"
-        }
-        
-        filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        export_timestamp = datetime.now().isoformat()
+        user_models = session.get('user_models', [])
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(chat_data, f, indent=2, ensure_ascii=False)
+        def export_generator():
+            # Emit the same indented document json.dump(indent=2) produced, one chat at a time
+            try:
+                yield b'{\n  "export_timestamp": ' + orjson.dumps(export_timestamp) + b',\n  "chat_histories": {'
+                for i, chat_id in enumerate(chat_ids):
+                    # content_lower is a search aid, keep it out of the export format
+                    messages = [{k: v for k, v in m.items() if k != 'content_lower'} for m in store.messages(chat_id)]
+                    messages = orjson.dumps(messages, option=orjson.OPT_INDENT_2).replace(b"\n", b"\n    ")
+                    yield (b",\n    " if i else b"\n    ") + orjson.dumps(chat_id) + b": " + messages
+                yield b'\n  },\n  "user_models": ' + orjson.dumps(user_models) + b',\n  "version": "1.0"\n}'
+            except Exception as e:
+                # Re-raise so the server aborts the response instead of ending a truncated file cleanly
+                logger.error(f"Export stream error: {str(e)}")
+                raise
         
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        return Response(
+            stream_with_context(export_generator()),
+            mimetype='application/json',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
     except Exception as e:
         logger.error(f"Export error: {str(e)}")
         return jsonify({
@@ -475,42 +989,68 @@ def import_chats():
                 "message": "Only JSON files are allowed for import."
             }), 400
         
-        # Read and parse JSON
-        try:
-            content = file.read().decode('utf-8')
-            data = json.loads(content)
-        except UnicodeDecodeError:
-            return jsonify({
-                "error": "File encoding error",
-                "message": "Unable to read the file. Please ensure it's a valid UTF-8 encoded JSON file."
-            }), 400
-        except json.JSONDecodeError as e:
-            return jsonify({
-                "error": "Invalid JSON format",
-                "message": f"The file contains invalid JSON: {str(e)}"
-            }), 400
-        
-        if 'chat_histories' not in data:
-            return jsonify({
-                "error": "Invalid file format",
-                "message": "The file doesn't contain valid chat history data."
-            }), 400
-        
-        # Merge with existing chat histories
-        if 'chat_histories' not in session:
-            session['chat_histories'] = {}
-        
-        imported_count = 0
-        for chat_id, messages in data['chat_histories'].items():
-            if chat_id not in session['chat_histories']:
-                session['chat_histories'][chat_id] = messages
-                imported_count += 1
+        # Parse the upload in one streaming pass, staging each checked chat on
+        # disk; the chats reach the store only once the whole file is valid
+        store = get_chat_store()
+        found_chats = False
+        imported_models = []
+        with tempfile.TemporaryDirectory(prefix="import-") as staging_root:
+            staging = FileChatStore(staging_root, "staged")
+            chats_seen = 0
+            try:
+                for kind, key, value in iter_import_file(file.stream):
+                    if kind == "chat_histories":
+                        found_chats = True
+                    elif kind == "model":
+                        imported_models.append(value)
+                    else:
+                        chats_seen += 1
+                        if chats_seen > Config.MAX_IMPORT_CHATS:
+                            return jsonify({
+                                "error": "Import too large",
+                                "message": f"The file contains more than {Config.MAX_IMPORT_CHATS} chats."
+                            }), 400
+                        if value is None:
+                            return jsonify({
+                                "error": "Import too large",
+                                "message": f"A chat in the file has more than "
+                                           f"{Config.MAX_IMPORT_MESSAGES_PER_CHAT} messages."
+                            }), 400
+                        if not is_valid_chat_id(key) or not isinstance(value, list) \
+                                or not all(is_valid_message(m) for m in value):
+                            logger.warning(f"Skipping invalid chat {key!r} in import")
+                            continue
+                        staging.create(key, [clean_message(m) for m in value])
+            except ijson.JSONError as e:
+                if not is_utf8_stream(file.stream):
+                    return jsonify({
+                        "error": "File encoding error",
+                        "message": "Unable to read the file. Please ensure it's a valid UTF-8 encoded JSON file."
+                    }), 400
+                return jsonify({
+                    "error": "Invalid JSON format",
+                    "message": f"The file contains invalid JSON: {str(e)}"
+                }), 400
+            
+            if not found_chats:
+                return jsonify({
+                    "error": "Invalid file format",
+                    "message": "The file doesn't contain valid chat history data."
+                }), 400
+            
+            imported_count = 0
+            for chat_id in staging.chat_ids():
+                if not store.exists(chat_id):
+                    store.create(chat_id, staging.messages(chat_id))
+                    imported_count += 1
         
         # Import user models if available
-        if 'user_models' in data:
+        if imported_models:
             if 'user_models' not in session:
                 session['user_models'] = []
-            for model in data['user_models']:
+            for model in imported_models:
+                if not isinstance(model, str) or len(model) > 100 or not model_name_pattern.match(model):
+                    continue
                 if model not in session['user_models']:
                     session['user_models'].append(model)
         
@@ -528,9 +1068,10 @@ def import_chats():
         }), 500
 
 @app.route("/", methods=["GET"])
+@cache.cached(key_prefix=index_cache_key, response_filter=has_model_options)
 def index():
     """Render main chat interface."""
-    return render_template('index.html', models=get_user_models())
+    return base_page_html().replace(MODEL_OPTIONS_PLACEHOLDER, render_model_options(tuple(get_user_models())))
 
 @app.route("/stream_chat", methods=["POST"])
 def stream_chat():
@@ -546,7 +1087,7 @@ def stream_chat():
         chat_id = data['chat_id'].strip()
 
         # Initialize chat history if not present
-        if 'chat_histories' not in session or chat_id not in session['chat_histories']:
+        if not get_chat_store().exists(chat_id):
             initialize_chat_history(chat_id)
         
         available_models = get_user_models()
@@ -565,48 +1106,70 @@ def stream_chat():
 
         def sse_generator():
             try:
-                # Launch the LLM subprocess
-                with subprocess.Popen(
-                    [Config.OLLAMA_PATH, "run", model],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    bufsize=1
-                ) as proc:
-                    if proc.stdin:
-                        proc.stdin.write(full_prompt)
-                        proc.stdin.close()
-                        logger.debug(f"Written prompt to Ollama subprocess for chat_id {chat_id}.")
-                    
+                # Stream from the Ollama daemon, which keeps the model loaded between turns
+                with ollama_http.post(
+                    f"{Config.OLLAMA_API_URL}/api/generate",
+                    json={"model": model, "prompt": full_prompt, "stream": True},
+                    stream=True,
+                    timeout=(5, None)
+                ) as r:
+                    if r.status_code != 200:
+                        try:
+                            err_msg = r.json().get("error", "")
+                        except ValueError:
+                            err_msg = r.text
+                        if r.status_code == 404:
+                            err_msg = f"Model not found. Please ensure the model is pulled with 'ollama pull': {err_msg}"
+                        logger.error(f"Ollama error for chat_id {chat_id}: {err_msg}")
+                        yield f"data: Error: {err_msg}\n\n"
+                        yield "data: [DONE]\n\n"
+                        return
+
                     assistant_response = ""
-                    # Stream and clean output line by line
-                    for line in proc.stdout:
-                        clean_line = ansi_escape.sub('', line)
-                        if clean_line.strip():
-                            logger.debug(f"Ollama output for chat_id {chat_id}: {clean_line.strip()}")
-                            assistant_response += clean_line
-                            yield f"data: {clean_line}\n\n"
-                    
+                    pending = ""
+                    # Completed lines waiting to be sent, as "data: <line>" fields of one SSE event
+                    batch = []
+                    batch_size = 0
+                    last_flush = time.monotonic()
+                    error = None
+                    # Tokens arrive as NDJSON; forward them to the client split into lines
+                    for raw_line in r.iter_lines():
+                        if not raw_line:
+                            continue
+                        chunk = orjson.loads(raw_line)
+                        if chunk.get("error"):
+                            error = chunk["error"]
+                            break
+
+                        token = chunk.get("response", "")
+                        assistant_response += token
+                        pending += token
+                        *lines, pending = pending.split("\n")
+                        for line in lines:
+                            if line.strip():
+                                batch.append(f"data: {line}\n")
+                                batch_size += len(line)
+                        if chunk.get("done"):
+                            break
+                        # Coalesce lines for up to SSE_BATCH_INTERVAL or SSE_BATCH_BYTES
+                        if batch and (batch_size >= Config.SSE_BATCH_BYTES
+                                      or time.monotonic() - last_flush >= Config.SSE_BATCH_INTERVAL):
+                            yield "".join(batch) + "\n"
+                            batch.clear()
+                            batch_size = 0
+                            last_flush = time.monotonic()
+
+                    if pending.strip():
+                        batch.append(f"data: {pending}\n")
+                    if batch:
+                        yield "".join(batch) + "\n"
+                    if error:
+                        logger.error(f"Ollama error for chat_id {chat_id}: {error}")
+                        yield f"data: Error: {error}\n\n"
+
                     # Append assistant's response to chat history
                     append_message(chat_id, "assistant", assistant_response.strip())
                     
-                    # Check for any error output
-                    err_output = proc.stderr.read()
-                    return_code = proc.wait()
-                    if return_code != 0:
-                        error_messages = {
-                            1: "Model not found. Please ensure the model is pulled with 'ollama pull'",
-                            2: "Invalid model format or corrupted model",
-                            3: "Insufficient system resources",
-                            127: "Ollama command not found. Please ensure Ollama is installed and in PATH"
-                        }
-                        err_msg = error_messages.get(return_code, f"Ollama exited with code {return_code}")
-                        if err_output.strip():
-                            err_msg += f": {err_output.strip()}"
-                        logger.error(f"Ollama error for chat_id {chat_id}: {err_msg}")
-                        yield f"data: Error: {err_msg}\n\n"
-                    
                     yield "data: [DONE]\n\n"
             except Exception as e:
                 logger.error(f"Stream error for chat_id {chat_id}: {str(e)}")
@@ -633,9 +1196,7 @@ def reset_chat():
         
         chat_id = data['chat_id'].strip()
         
-        if 'chat_histories' in session and chat_id in session['chat_histories']:
-            del session['chat_histories'][chat_id]
-            session.modified = True
+        if get_chat_store().delete(chat_id):
             logger.info(f"Chat history for chat_id {chat_id} has been reset.")
             return jsonify({
                 "status": "success",
@@ -693,7 +1254,7 @@ def rate_limit_exceeded(error):
 # ---------------------------
 if __name__ == "__main__":
     logger.info(f"Starting server on {Config.HOST}:{Config.PORT}")
-    logger.info(f"Using Ollama path: {Config.OLLAMA_PATH}")
+    logger.info(f"Using Ollama API: {Config.OLLAMA_API_URL}")
     logger.info(f"Secret key configured: {'Yes' if Config.SECRET_KEY else 'No'}")
     logger.info(f"Debug mode: {'Enabled' if Config.DEBUG else 'Disabled'}")
     logger.info("CSRF protection: Disabled (local AI application)")
@@ -0,0 +1,16 @@
+# Gunicorn settings, picked up automatically by: gunicorn wsgi:application
+import multiprocessing
+
+bind = "0.0.0.0:5025"
+
+# gevent workers multiplex many long-lived SSE chat streams per process
+worker_class = "gevent"
+workers = multiprocessing.cpu_count()
+
+# Chat streams stay open for as long as the model keeps generating
+timeout = 0
+
+# gevent's libev loop uses its default backend (epoll on Linux). On Linux 5.6+
+# it can use io_uring for readiness polling instead, which is experimental in
+# libev and not always reliable; opt in with GEVENT_BACKEND=linux_iouring,epoll
+# to fall back to epoll when io_uring is unavailable.